@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright 2021 DataRobot, Inc. and its affiliates.
+#
+# All rights reserved.
+#
+# DataRobot, Inc. Confidential.
+#
+# This is unpublished proprietary source code of DataRobot, Inc.
+# and its affiliates.
+#
+# The copyright notice above does not evidence any actual or intended
+# publication of such source code.
+####################################################################################################
+# Benchmark for full_backup_script.py and full_db_restore_script.py
+
+# Builds synthetic DataRobot-shaped data on local PostgreSQL and MongoDB servers, runs the backup and
+# the restore against them through a stub kubectl and records the time and throughput of every phase.
+# Results can be saved as a baseline and later runs compared with it.
+
+# Usage: run from this directory against throwaway servers. The backup dumps, and the restore
+# overwrites, every database on them.
+
+# Example: backup_benchmark.py /tmp/benchmark --pg-port 5432 --pg-password secret --mongo-port 27017 --mongo-password secret \
+#          --backup-args "--parallel-dbs 2 --compression zstd" --baseline baseline.json
+
+# With --check it instead backs up and restores small fixtures over the exec transport and from streamed
+# shards, and exits with status 1 unless every archive verifies and every row and document comes back.
+
+# Example: backup_benchmark.py /tmp/benchmark --check --pg-port 5432 --pg-password secret --mongo-port 27017
+####################################################################################################
+
+import argparse
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import backup_common
+import full_backup_script as backup
+import full_db_restore_script as restore
+
+BENCHMARK_NAMESPACE = "backup-benchmark"
+
+# Stands in for kubectl: answers the secret lookups, puts one pod behind every service, forwards
+# port-forwards to the local servers and runs 'exec' commands on this host
+STUB_KUBECTL = r'''#!%(python)s
+import base64, json, os, socket, sys, threading
+
+args = sys.argv[1:]
+if "get" in args and "secret" in args:
+    name = args[args.index("secret") + 1]
+    password = os.environ["BENCHMARK_MONGO_PASSWORD" if "mongo" in name else "BENCHMARK_PG_PASSWORD"]
+    print(base64.b64encode(password.encode()).decode(), end="")
+elif "get" in args and "pods" in args:
+    print(json.dumps({"items": [{"metadata": {"name": "benchmark-0"}, "status": {"phase": "Running"}}]}))
+elif "get" in args:
+    print(json.dumps({"spec": {"selector": {"app": "benchmark"}}}))
+elif "port-forward" in args:
+    local_port, remote_port = args[-1].split(":")
+    server_port = int(os.environ["BENCHMARK_PG_PORT" if remote_port == "5432" else "BENCHMARK_MONGO_PORT"])
+
+    def pump(source, target):
+        try:
+            for data in iter(lambda: source.recv(65536), b""):
+                target.sendall(data)
+        except OSError:
+            pass
+        try:
+            target.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    def handle(client):
+        server = socket.create_connection(("127.0.0.1", server_port))
+        threads = [threading.Thread(target=pump, args=pair) for pair in ((client, server), (server, client))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        client.close()
+        server.close()
+
+    listener = socket.create_server(("127.0.0.1", int(local_port)))
+    print(f"Forwarding from 127.0.0.1:{local_port} -> {server_port}", flush=True)
+    while True:
+        client, _ = listener.accept()
+        threading.Thread(target=handle, args=(client,), daemon=True).start()
+elif "exec" in args:
+    cmd = args[args.index("--") + 1:]
+    if "--port" in cmd:
+        cmd[cmd.index("--port") + 1] = os.environ["BENCHMARK_MONGO_PORT"]
+    os.environ["PGPORT"] = os.environ["BENCHMARK_PG_PORT"]
+    os.execvp(cmd[0], cmd)
+else:
+    sys.exit(f"stub kubectl: unsupported command {args}")
+'''
+
+# Two application databases, one with a partitioned prediction results table whose partitions live
+# in _prediction_result_partitions like in modmon
+PG_FIXTURES = {
+    "bench_modmon": """
+CREATE SCHEMA _prediction_result_partitions;
+CREATE TABLE public.prediction_results (
+    deployment_id int NOT NULL, row_id bigint NOT NULL, prediction double precision, prediction_class text,
+    created_at timestamptz NOT NULL, features jsonb
+) PARTITION BY LIST (deployment_id);
+DO $$ BEGIN
+    FOR i IN 0..%(partitions)d - 1 LOOP
+        EXECUTE format('CREATE TABLE _prediction_result_partitions.prediction_results_%%s PARTITION OF public.prediction_results FOR VALUES IN (%%s)', i, i);
+    END LOOP;
+END $$;
+CREATE INDEX ON public.prediction_results (deployment_id, row_id);
+INSERT INTO public.prediction_results
+SELECT g %% %(partitions)d, g, random(), CASE WHEN random() < 0.5 THEN 'yes' ELSE 'no' END, now() - g * interval '1 second',
+       jsonb_build_object('age', g %% 90, 'income', random() * 100000, 'zip', lpad((g %% 99999)::text, 5, '0'), 'note', md5(g::text))
+FROM generate_series(1, %(rows)d) g;
+""",
+    "bench_app": """
+CREATE TABLE public.projects (id bigserial PRIMARY KEY, name text, description text, settings jsonb, created_at timestamptz);
+INSERT INTO public.projects (name, description, settings, created_at)
+SELECT 'project ' || g, repeat(md5(g::text), 8), jsonb_build_object('target', 'col_' || g %% 50, 'metric', 'LogLoss', 'cv', g %% 10),
+       now() - g * interval '1 minute'
+FROM generate_series(1, %(rows)d / 10) g;
+CREATE TABLE public.events (id bigserial PRIMARY KEY, project_id bigint, kind text, payload text, created_at timestamptz);
+INSERT INTO public.events (project_id, kind, payload, created_at)
+SELECT g %% (%(rows)d / 10) + 1, (ARRAY['create', 'update', 'predict', 'delete'])[g %% 4 + 1], md5(g::text) || md5((g + 1)::text), now()
+FROM generate_series(1, %(rows)d) g;
+""",
+}
+
+# Wide MMApp-like project documents plus a smaller collection of narrow ones
+MONGO_FIXTURE_SCRIPT = """
+const docs = %(docs)d, fields = %(fields)d;
+const target = db.getSiblingDB("bench_MMApp");
+target.dropDatabase();
+let batch = [];
+for (let i = 0; i < docs; i++) {
+  const doc = {pid: i, created: new Date(), tags: ["partition_" + (i %% 13), "stage_" + (i %% 7)], metrics: {}, holdout: {rows: i %% 1000, scores: [Math.random(), Math.random(), Math.random()]}};
+  for (let f = 0; f < fields; f++) {
+    doc["feature_" + f] = f %% 3 === 0 ? i * f : f %% 3 === 1 ? "value_" + ((i * 31 + f) %% 1000) : {type: "numeric", importance: Math.random()};
+  }
+  for (let m = 0; m < 20; m++) {
+    doc.metrics["metric_" + m] = {validation: Math.random(), crossValidation: Math.random()};
+  }
+  batch.push(doc);
+  if (batch.length === 1000) {
+    target.projects.insertMany(batch, {ordered: false});
+    batch = [];
+  }
+}
+if (batch.length) target.projects.insertMany(batch, {ordered: false});
+target.projects.createIndex({pid: 1});
+for (let start = 0; start < docs; start += 1000) {
+  const items = [];
+  for (let i = start; i < Math.min(start + 1000, docs); i++) items.push({pid: i, model: "model_" + (i %% 40), score: Math.random()});
+  target.leaderboard.insertMany(items, {ordered: false});
+}
+"""
+
+# Backup options and restore arguments of the --check scenarios. Both go through the stub kubectl:
+# dumps run with 'exec', and the sharded archives are read member by member by the streamed restore.
+CHECK_SCENARIOS = (
+    ("exec transport", "--transport exec --exec-streams 2", {"transport": "exec"}),
+    ("streamed shards over exec", "--transport exec --archive-shards 3", {"transport": "exec", "stream": True}),
+    ("streamed shards over port-forward", "--stream --archive-shards 3", {"stream": True}),
+)
+
+# Tables and collections whose counts --check compares before the backup and after the restore
+CHECK_TABLES = (("bench_modmon", "public.prediction_results"), ("bench_app", "public.projects"), ("bench_app", "public.events"))
+CHECK_COLLECTIONS = ("projects", "leaderboard")
+
+# Fixture sizes of a benchmark run and of --check
+FIXTURE_DEFAULTS = {"pg_rows": (1000000, 2000), "partitions": (500, 20), "mongo_docs": (100000, 500), "doc_fields": (200, 20)}
+
+class PhaseRecorder:
+    # Wraps full_backup_script.set_status to time the phases each store's backup goes through.
+    # Phases are keyed by their first word, so progress updates within a phase do not split it.
+    def __init__(self, set_status):
+        self.set_status = set_status
+        self.current = {}
+        self.seconds = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, store, phase, path=None):
+        name = re.split(r"[\s:]", phase)[0]
+        with self.lock:
+            if self.current.get(store, (None,))[0] != name:
+                self.close(store)
+                self.current[store] = (name, time.monotonic())
+        self.set_status(store, phase, path)
+
+    def close(self, store):
+        previous = self.current.pop(store, None)
+        if previous:
+            key = f"{store} backup: {previous[0]}"
+            self.seconds[key] = self.seconds.get(key, 0) + time.monotonic() - previous[1]
+
+def psql(args, db, sql):
+    subprocess.run(["psql", "-Upostgres", "-h127.0.0.1", f"-p{args.pg_port}", "-v", "ON_ERROR_STOP=1", "-q", "-d", db, "-c", sql], check=True)
+
+def admin_mongo_uri(args):
+    return backup.mongo_uri(args.mongo_password, args.mongo_port)
+
+def ensure_mongo_user(args):
+    # The scripts log in as pcs-mongodb; on a server without auth the user is created first
+    try:
+        subprocess.run(["mongosh", "--quiet", admin_mongo_uri(args), "--eval", "db.runCommand({ping: 1})"],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except subprocess.CalledProcessError:
+        subprocess.run(["mongosh", "--quiet", f"mongodb://127.0.0.1:{args.mongo_port}/?directConnection=true", "--eval",
+                        f"db.getSiblingDB('admin').createUser({{user: 'pcs-mongodb', pwd: {json.dumps(args.mongo_password)}, roles: ['root']}})"],
+                       check=True)
+
+def generate_fixtures(args):
+    if "postgres" in args.stores:
+        for db, sql in PG_FIXTURES.items():
+            print(f"Generating PostgreSQL database {db}")
+            psql(args, "postgres", f"DROP DATABASE IF EXISTS {db}")
+            psql(args, "postgres", f"CREATE DATABASE {db}")
+            psql(args, db, sql % {"rows": args.pg_rows, "partitions": args.partitions})
+    if "mongodb" in args.stores:
+        ensure_mongo_user(args)
+        print("Generating MongoDB database bench_MMApp")
+        subprocess.run(["mongosh", "--quiet", admin_mongo_uri(args), "--eval",
+                        MONGO_FIXTURE_SCRIPT % {"docs": args.mongo_docs, "fields": args.doc_fields}], check=True)
+
+def source_bytes(args, store):
+    # Everything on the server is backed up, so throughput is measured against all of it
+    if store == "postgres":
+        return sum(backup.get_postgres_database_sizes(args.pg_port, backup.list_postgres_databases(args.pg_port)).values())
+    return sum(backup.get_mongo_database_sizes(admin_mongo_uri(args)).values())
+
+def setup_stub_kubectl(args, work_dir):
+    stub_path = os.path.join(work_dir, "kubectl")
+    with open(stub_path, "w") as stub_file:
+        stub_file.write(STUB_KUBECTL % {"python": sys.executable})
+    os.chmod(stub_path, 0o755)
+    os.environ.update({"KUBECTL": stub_path, "PGPASSWORD": args.pg_password,
+                       "BENCHMARK_PG_PORT": str(args.pg_port), "BENCHMARK_PG_PASSWORD": args.pg_password,
+                       "BENCHMARK_MONGO_PORT": str(args.mongo_port), "BENCHMARK_MONGO_PASSWORD": args.mongo_password})
+    backup_common.KUBECTL = backup.KUBECTL = restore.KUBECTL = stub_path
+
+def store_archives(backup_location, prefix):
+    # Every archive of a store: a single tar, or the index of a sharded or per-database archive
+    archives = set()
+    for name in os.listdir(backup_location):
+        if not name.startswith(prefix):
+            continue
+        for index_suffix in (".shards.json", ".catalog.json"):
+            if name.endswith(index_suffix):
+                archives.add(name[:-len(index_suffix)] + ".tar")
+        if name.endswith(".tar") and ".shard-" not in name:
+            archives.add(name)
+    return [os.path.join(backup_location, name) for name in sorted(archives)]
+
+def archive_bytes(backup_location, prefix):
+    return sum(os.path.getsize(part) for archive in store_archives(backup_location, prefix) for part in backup_common.archive_parts(archive))
+
+def restore_options(backup_args, store):
+    # The restore finds what the backup wrote: chunks in the repository, or the oplog slices of an incremental chain
+    options = {"repository": backup_args.repository, "transport": backup_args.transport}
+    if store == "mongodb":
+        options["incremental"] = backup_args.mongo_incremental
+    return options
+
+def timed_phase(phases, name, task, size):
+    print(f"[benchmark] {name}")
+    started = time.monotonic()
+    task()
+    record_phase(phases, name, time.monotonic() - started, size)
+
+def record_phase(phases, name, seconds, size):
+    phases[name] = {"seconds": round(seconds, 2), "source_bytes": size,
+                    "mb_per_s": round(size / seconds / 1024 ** 2, 2) if seconds else None}
+
+def run_benchmark(args):
+    work_dir = tempfile.mkdtemp(prefix="backup-benchmark-", dir=args.work_dir)
+    backup_location = os.path.join(work_dir, "backup")
+    setup_stub_kubectl(args, work_dir)
+    if not args.reuse_fixtures:
+        generate_fixtures(args)
+
+    backup_args = backup.parse_args([BENCHMARK_NAMESPACE, backup_location] + shlex.split(args.backup_args))
+    backup.create_backup_directory(backup_location)
+    if "auto" in backup_args.store_compression.values():
+        backup.resolve_auto_compression(backup_args, backup.measure_database_sizes(BENCHMARK_NAMESPACE))
+    postgres_backup, mongo_backup = backup.store_backups(backup_args)
+    recorder = PhaseRecorder(backup.set_status)
+    backup.set_status = recorder
+
+    phases = {}
+    archives = {}
+    try:
+        for store, store_backup, store_restore, prefix in (
+                ("postgres", postgres_backup, restore.postgres_restore, "pgsql-backup-"),
+                ("mongodb", mongo_backup, restore.mongo_restore, "datarobot-mongo-backup-")):
+            if store not in args.stores:
+                continue
+            size = source_bytes(args, store)
+            # With --repository only the chunks the backup added count
+            repository_bytes = backup_common.disk_usage(backup_args.repository) if backup_args.repository else 0
+            timed_phase(phases, f"{store} backup", store_backup, size)
+            recorder.close(store)
+            for key, seconds in sorted(recorder.seconds.items()):
+                if key.startswith(f"{store} "):
+                    record_phase(phases, key, seconds, size)
+            if backup_args.repository:
+                archives[store] = backup_common.disk_usage(backup_args.repository) - repository_bytes
+            else:
+                archives[store] = archive_bytes(backup_location, prefix)
+            if not args.skip_restore:
+                timed_phase(phases, f"{store} restore",
+                            lambda: store_restore(BENCHMARK_NAMESPACE, backup_location, **restore_options(backup_args, store)), size)
+    finally:
+        backup.set_status = recorder.set_status
+        backup_common.close_port_forwards(backup_common.PORT_FORWARDS)
+        if args.keep:
+            print(f"Backup files kept in {backup_location}")
+        else:
+            shutil.rmtree(work_dir)
+
+    return {"date": datetime.now().isoformat(timespec="seconds"), "backup_args": args.backup_args,
+            "fixture": {"pg_rows": args.pg_rows, "partitions": args.partitions, "mongo_docs": args.mongo_docs, "doc_fields": args.doc_fields},
+            "archive_bytes": archives, "phases": phases}
+
+def fixture_counts(args):
+    counts = {}
+    if "postgres" in args.stores:
+        for db, table in CHECK_TABLES:
+            output = subprocess.check_output(["psql", "-Upostgres", "-h127.0.0.1", f"-p{args.pg_port}", "-tAq", "-d", db,
+                                              "-c", f"SELECT count(*) FROM {table}"])
+            counts[f"{db}.{table}"] = int(output.decode().strip())
+    if "mongodb" in args.stores:
+        script = "const target = db.getSiblingDB('bench_MMApp'); print(JSON.stringify({%s}))" % ", ".join(
+            f"{name}: target.{name}.countDocuments({{}})" for name in CHECK_COLLECTIONS)
+        output = subprocess.check_output(["mongosh", "--quiet", admin_mongo_uri(args), "--eval", script])
+        counts.update({f"bench_MMApp.{name}": count for name, count in json.loads(output.decode().strip().splitlines()[-1]).items()})
+    return counts
+
+def empty_fixtures(args, store):
+    # Emptied before every restore, so a restore that silently loads nothing can not pass
+    if store == "postgres":
+        for db, table in CHECK_TABLES:
+            psql(args, db, f"DELETE FROM {table}")
+    else:
+        subprocess.run(["mongosh", "--quiet", admin_mongo_uri(args), "--eval",
+                        "; ".join(f"db.getSiblingDB('bench_MMApp').{name}.deleteMany({{}})" for name in CHECK_COLLECTIONS)],
+                       check=True, stdout=subprocess.DEVNULL)
+
+def check_scenario(args, work_dir, backup_options, restore_options, expected):
+    backup_location = os.path.join(work_dir, "backup")
+    backup_args = backup.parse_args([BENCHMARK_NAMESPACE, backup_location] + shlex.split(backup_options))
+    backup.create_backup_directory(backup_location)
+    postgres_backup, mongo_backup = backup.store_backups(backup_args)
+    problems = []
+    for store, store_backup, store_restore, prefix in (
+            ("postgres", postgres_backup, restore.postgres_restore, "pgsql-backup-"),
+            ("mongodb", mongo_backup, restore.mongo_restore, "datarobot-mongo-backup-")):
+        if store not in args.stores:
+            continue
+        store_backup()
+        archives = store_archives(backup_location, prefix)
+        if not archives:
+            problems.append(f"no {store} archive written")
+        problems += [f"{archive} does not verify" for archive in archives if not backup.verify_backup(archive, 2)]
+        empty_fixtures(args, store)
+        store_restore(BENCHMARK_NAMESPACE, backup_location, **restore_options)
+
+    counts = fixture_counts(args)
+    problems += [f"{name}: {counts.get(name)} after the restore, {count} before the backup"
+                 for name, count in expected.items() if counts.get(name) != count]
+    shutil.rmtree(backup_location)
+    return problems
+
+def run_check(args):
+    work_dir = tempfile.mkdtemp(prefix="backup-check-", dir=args.work_dir)
+    setup_stub_kubectl(args, work_dir)
+    if not args.reuse_fixtures:
+        generate_fixtures(args)
+    expected = fixture_counts(args)
+
+    results = {}
+    try:
+        for name, backup_options, restore_options in CHECK_SCENARIOS:
+            print(f"[check] {name}: {backup_options}")
+            try:
+                results[name] = check_scenario(args, work_dir, backup_options, restore_options, expected)
+            except Exception as exc:
+                results[name] = [f"{type(exc).__name__}: {exc}"]
+    finally:
+        backup_common.close_port_forwards(backup_common.PORT_FORWARDS)
+        if args.keep:
+            print(f"Check files kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir)
+
+    print("Check results:")
+    for name, problems in results.items():
+        print(f"  {name}: {'FAIL' if problems else 'ok'}")
+        for problem in problems:
+            print(f"    {problem}")
+    return not any(results.values())
+
+def compare_with_baseline(results, baseline, tolerance):
+    # A phase regresses when it takes more than tolerance longer than in the baseline
+    if baseline["fixture"] != results["fixture"] or baseline["backup_args"] != results["backup_args"]:
+        print("Warning: the baseline was recorded with other fixtures or backup arguments")
+    regressions = []
+    for name, phase in results["phases"].items():
+        base = baseline["phases"].get(name)
+        if not base or not base["seconds"]:
+            print(f"  {name}: {phase['seconds']:.1f}s, not in the baseline")
+            continue
+        change = phase["seconds"] / base["seconds"] - 1
+        verdict = "REGRESSION" if change > tolerance else "faster" if change < -tolerance else "unchanged"
+        print(f"  {name}: {base['seconds']:.1f}s -> {phase['seconds']:.1f}s ({change:+.0%}, "
+              f"{base['mb_per_s']} -> {phase['mb_per_s']} MB/s) {verdict}")
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
+
+def print_results(results):
+    print("Benchmark results:")
+    for name, phase in results["phases"].items():
+        print(f"  {name}: {phase['seconds']:.1f}s, {phase['mb_per_s']} MB/s of {backup.format_bytes(phase['source_bytes'])}")
+    for store, size in results["archive_bytes"].items():
+        print(f"  {store} archive: {backup.format_bytes(size)}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark full_backup_script.py and full_db_restore_script.py against local servers")
+    parser.add_argument('work_dir', help="Directory for the stub kubectl and the backup files of the run.")
+    parser.add_argument('--pg-port', type=int, default=5432, help="Port of the local PostgreSQL server (default: 5432).")
+    parser.add_argument('--pg-password', default=os.environ.get("PGPASSWORD", ""), help="Password of the postgres user (default: $PGPASSWORD).")
+    parser.add_argument('--mongo-port', type=int, default=27017, help="Port of the local MongoDB server (default: 27017).")
+    parser.add_argument('--mongo-password', default="benchmark", help="Password of the pcs-mongodb user, created when the server has no auth (default: benchmark).")
+    parser.add_argument('--stores', default="postgres,mongodb", help="Comma separated stores to benchmark (default: postgres,mongodb).")
+    parser.add_argument('--pg-rows', type=int, default=None, help="Rows in the prediction results and events tables (default: 1000000, 2000 with --check).")
+    parser.add_argument('--partitions', type=int, default=None, help="Partitions of the prediction results table (default: 500, 20 with --check).")
+    parser.add_argument('--mongo-docs', type=int, default=None, help="Documents in the MongoDB projects collection (default: 100000, 500 with --check).")
+    parser.add_argument('--doc-fields', type=int, default=None, help="Top-level fields per MongoDB project document (default: 200, 20 with --check).")
+    parser.add_argument('--reuse-fixtures', action='store_true', help="Do not regenerate the synthetic databases.")
+    parser.add_argument('--backup-args', default="", help="Options passed to full_backup_script.py, for example \"--stream --compression zstd\".")
+    parser.add_argument('--skip-restore', action='store_true', help="Only benchmark the backup.")
+    parser.add_argument('--keep', action='store_true', help="Keep the backup files of the run.")
+    parser.add_argument('--output', default=None, help="Write the results as JSON to this file.")
+    parser.add_argument('--baseline', default=None, help="Compare with a results file of an earlier run; exit status 1 on a regression.")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Slowdown of a phase counted as a regression (default: 0.1 = 10%%).")
+    parser.add_argument('--check', action='store_true',
+                        help="Instead of benchmarking, back up and restore small fixtures over the exec transport and from streamed "
+                             "archive shards and exit with status 1 unless every archive verifies and all rows and documents are restored.")
+    args = parser.parse_args()
+    if args.check and (args.backup_args or args.skip_restore or args.output or args.baseline):
+        parser.error("--check can not be combined with --backup-args, --skip-restore, --output or --baseline")
+    for name, (benchmark_default, check_default) in FIXTURE_DEFAULTS.items():
+        if getattr(args, name) is None:
+            setattr(args, name, check_default if args.check else benchmark_default)
+    args.stores = args.stores.split(",")
+    args.work_dir = os.path.abspath(args.work_dir)
+    os.makedirs(args.work_dir, exist_ok=True)
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.check:
+        sys.exit(0 if run_check(args) else 1)
+    results = run_benchmark(args)
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        print(f"Compared with {args.baseline}:")
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
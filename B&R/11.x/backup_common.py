@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright 2021 DataRobot, Inc. and its affiliates.
+#
+# All rights reserved.
+#
+# DataRobot, Inc. Confidential.
+#
+# This is unpublished proprietary source code of DataRobot, Inc.
+# and its affiliates.
+#
+# The copyright notice above does not evidence any actual or intended
+# publication of such source code.
+####################################################################################################
+# Helpers shared by full_backup_script.py, full_db_restore_script.py and backup_benchmark.py:
+# kubectl port-forwards, the combined progress line, the --trace timeline, size-ordered scheduling
+# within a worker budget, the sharded archive layout and the progress reporting of mongodump/mongorestore.
+
+# Usage: copy this file next to the scripts, they import it from their own directory.
+####################################################################################################
+
+# pylint: disable=W0141
+
+import atexit
+import contextlib
+import json
+import os
+import re
+import resource
+import socket
+import struct
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# kubectl binary, overridable to point the scripts at a wrapper or a stand-in
+KUBECTL = os.environ.get("KUBECTL", "kubectl")
+
+PORT_FORWARDS = []
+
+# Containers the tools run in with --transport exec, as in upgrade/11.x/upgrade.sh, and commands printing
+# t / true only in the pod of the primary
+EXEC_CONTAINERS = {"postgres": "postgresql", "mongodb": "mongodb"}
+PRIMARY_CHECKS = {"postgres": ["psql", "-Upostgres", "-hlocalhost", "-tAc", "SELECT NOT pg_is_in_recovery()"],
+                  "mongodb": ["mongosh", "--quiet", "--port", "27017", "--eval", "db.hello().isWritablePrimary"]}
+PRIMARY_PODS = {}
+PRIMARY_LOCK = threading.Lock()
+
+def find_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def probe_postgres(sock):
+    # SSLRequest: any PostgreSQL server answers with a single 'S' or 'N' byte
+    sock.sendall(struct.pack("!II", 8, 80877103))
+    return sock.recv(1) in (b"S", b"N")
+
+def probe_mongodb(sock):
+    # OP_MSG {hello: 1, $db: "admin"}; any reply means mongod is reachable through the tunnel
+    body = b"\x10hello\x00" + struct.pack("<i", 1) + b"\x02$db\x00" + struct.pack("<i", 6) + b"admin\x00"
+    document = struct.pack("<i", len(body) + 5) + body + b"\x00"
+    message = struct.pack("<iB", 0, 0) + document
+    sock.sendall(struct.pack("<iiii", len(message) + 16, 1, 0, 2013) + message)
+    return len(sock.recv(16)) == 16
+
+class PortForward:
+    # kubectl port-forward on a free local port that is only handed out once the database answers through it
+    def __init__(self, namespace, target, remote_port, probe, timeout=300):
+        self.target = target
+        self.local_port = find_free_port()
+        self.process = subprocess.Popen([KUBECTL, "-n", namespace, "port-forward", target, "--address", "127.0.0.1",
+                                         f"{self.local_port}:{remote_port}"],
+                                        stdout=subprocess.DEVNULL, start_new_session=True)
+        PORT_FORWARDS.append(self)
+        with TRACE.span(f"port-forward {target}", "kubectl"):
+            self.wait_until_ready(probe, timeout)
+
+    def wait_until_ready(self, probe, timeout):
+        started = time.monotonic()
+        delay = 0.01
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"kubectl port-forward to {self.target} exited with status {self.process.returncode}")
+            try:
+                with socket.create_connection(("127.0.0.1", self.local_port), timeout=5) as sock:
+                    sock.settimeout(5)
+                    if probe(sock):
+                        print(f"{self.target} is ready on 127.0.0.1:{self.local_port} after {time.monotonic() - started:.2f}s")
+                        return
+            except OSError:
+                pass
+            if time.monotonic() - started > timeout:
+                self.close()
+                raise TimeoutError(f"{self.target} did not become ready through port-forward within {timeout}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 1)
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self in PORT_FORWARDS:
+            PORT_FORWARDS.remove(self)
+
+def exec_command(namespace, store, target, cmd, env=None):
+    # Runs cmd in the database container of the pod; its stdout comes back over the exec stream instead of a
+    # port-forward tunnel. A service target is replaced by its primary pod.
+    env_args = ["env"] + [f"{name}={value}" for name, value in env.items()] if env else []
+    return ([KUBECTL, "-n", namespace, "exec", "-i", primary_pod(namespace, store, target), "-c", EXEC_CONTAINERS[store], "--"]
+            + env_args + cmd)
+
+def service_pods(namespace, service):
+    # Running pods matched by the selector of the service
+    selector = json.loads(subprocess.check_output([KUBECTL, "-n", namespace, "get", service, "-o", "json"]))["spec"]["selector"]
+    output = subprocess.check_output([KUBECTL, "-n", namespace, "get", "pods", "-o", "json",
+                                      "-l", ",".join(f"{key}={value}" for key, value in sorted(selector.items()))])
+    return sorted(item["metadata"]["name"] for item in json.loads(output)["items"] if item["status"].get("phase") == "Running")
+
+def primary_pod(namespace, store, target):
+    # kubectl exec svc/... runs in whichever pod kubectl picks behind the service, which can be a read-only
+    # standby or secondary. The pods behind it are asked in turn, once per run, and the first primary is used.
+    if not target.startswith("svc/"):
+        return target
+    with PRIMARY_LOCK:
+        if (namespace, target) not in PRIMARY_PODS:
+            env = {"PGPASSWORD": os.environ.get("PGPASSWORD", "")} if store == "postgres" else None
+            for pod in service_pods(namespace, target):
+                try:
+                    output = subprocess.check_output(exec_command(namespace, store, f"pod/{pod}", PRIMARY_CHECKS[store], env),
+                                                     stderr=subprocess.DEVNULL, timeout=60).decode().split()
+                except (OSError, subprocess.SubprocessError):
+                    continue
+                if output[-1:] in (["t"], ["true"]):
+                    print(f"Running {store} tools with kubectl exec in primary pod {pod}")
+                    PRIMARY_PODS[(namespace, target)] = f"pod/{pod}"
+                    break
+            else:
+                raise RuntimeError(f"No primary pod found behind {target} in namespace {namespace}")
+        return PRIMARY_PODS[(namespace, target)]
+
+def open_port_forwards(namespace, target, remote_port, probe, count):
+    # Separate tunnels for parallel streams; opened concurrently since each one waits for readiness
+    if count <= 0:
+        return []
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        return list(executor.map(lambda _: PortForward(namespace, target, remote_port, probe), range(count)))
+
+def close_port_forwards(forwards):
+    for forward in list(forwards):
+        forward.close()
+
+atexit.register(close_port_forwards, PORT_FORWARDS)
+
+def disk_usage(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def format_duration(seconds):
+    return time.strftime("%H:%M:%S", time.gmtime(seconds))
+
+def format_bytes(num_bytes):
+    for unit in ["B", "KB", "MB", "GB", "TB"]:
+        if num_bytes < 1024 or unit == "TB":
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+# Current phase of each store's backup or restore, shown by the combined progress line
+STORE_STATUS = {}
+STATUS_LOCK = threading.Lock()
+
+def set_status(store, phase, path=None):
+    with STATUS_LOCK:
+        status = STORE_STATUS.setdefault(store, {"started": time.time()})
+        status["phase"] = phase
+        if path:
+            status["path"] = path
+
+def report_progress(stop_event, interval):
+    while not stop_event.wait(interval):
+        with STATUS_LOCK:
+            snapshot = {store: dict(status) for store, status in STORE_STATUS.items()}
+        parts = []
+        for store, status in sorted(snapshot.items()):
+            path = status.get("path")
+            written = f", {format_bytes(disk_usage(path) if os.path.exists(path) else 0)} written" if path else ""
+            parts.append(f"{store}: {status['phase']}{written}, {format_duration(time.time() - status['started'])} elapsed")
+        print(f"[progress] {' | '.join(parts)}", flush=True)
+
+def get_postgres_connection_budget(port, budget, parallel, tool):
+    # Every pg_dump/pg_restore -jN opens N worker connections plus one leader connection
+    output = subprocess.check_output(f"psql -Upostgres -hlocalhost -p{port} -t -A -c \"SELECT current_setting('max_connections')::int - current_setting('superuser_reserved_connections')::int - count(*) FROM pg_stat_activity;\"", shell=True).decode().strip()
+    free_connections = int(output) - parallel
+    if free_connections < budget:
+        print(f"Limiting {tool} workers to {max(1, free_connections)} because of available connections")
+    return max(1, min(budget, free_connections))
+
+def archive_parts(tar_file_path):
+    # Tar files holding an archive: the archive itself, every shard when it was packed with --archive-shards
+    # or every artifact when it was packed with --layout per-database
+    for index_suffix, key in ((".shards.json", "shards"), (".catalog.json", "artifacts")):
+        index_path = f"{tar_file_path[:-len('.tar')]}{index_suffix}"
+        if os.path.exists(index_path):
+            with open(index_path) as index_file:
+                parts = json.load(index_file)[key]
+            return [os.path.join(os.path.dirname(tar_file_path), part["name"]) for part in parts]
+    return [tar_file_path]
+
+def process_tree_rss():
+    # Resident memory of this script and every process it started (dumps, compressors, kubectl);
+    # only the script's own peak where /proc is not available
+    try:
+        children = {}
+        rss = {}
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as stat_file:
+                    fields = stat_file.read().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            children.setdefault(int(fields[1]), []).append(int(entry))
+            rss[int(entry)] = int(fields[21]) * page_size
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    total = 0
+    pending = [os.getpid()]
+    while pending:
+        pid = pending.pop()
+        total += rss.get(pid, 0)
+        pending.extend(children.get(pid, []))
+    return total
+
+class Tracer:
+    # Spans of the script's phases with wall time, bytes moved, throughput and the peak memory of the
+    # script and its tools while the span was open. Written with --trace as a Chrome trace that
+    # chrome://tracing or ui.perfetto.dev render as a timeline, one lane per thread.
+    def __init__(self):
+        self.path = None
+        self.events = []
+        self.open_spans = []
+        self.lanes = set()
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def enable(self, path, interval=0.5):
+        self.path = path
+        threading.Thread(target=self.sample_memory, args=(interval,), daemon=True).start()
+        # Registered last, so it runs before the cleanup handlers and also covers failed runs
+        atexit.register(self.write)
+
+    def sample_memory(self, interval):
+        while True:
+            rss = process_tree_rss()
+            with self.lock:
+                for span in self.open_spans:
+                    span["peak_rss"] = max(span["peak_rss"], rss)
+            time.sleep(interval)
+
+    @contextlib.contextmanager
+    def span(self, name, category, path=None):
+        # The caller may set span["bytes"]; otherwise it is the size of path when the span ends
+        span = {"bytes": None, "peak_rss": 0, "failed": False}
+        if self.path is None:
+            yield span
+            return
+        span["peak_rss"] = process_tree_rss()
+        start = time.monotonic()
+        with self.lock:
+            self.open_spans.append(span)
+        try:
+            yield span
+        except BaseException:
+            span["failed"] = True
+            raise
+        finally:
+            end = time.monotonic()
+            with self.lock:
+                self.open_spans.remove(span)
+            if span["bytes"] is None and path and os.path.exists(path):
+                span["bytes"] = disk_usage(path)
+            self.add_event(name, category, start, end, span)
+
+    def add_event(self, name, category, start, end, span):
+        thread = threading.current_thread()
+        args = {"bytes": span["bytes"], "peak_rss_mb": round(span["peak_rss"] / 1024 ** 2, 1)}
+        if span["bytes"] and end > start:
+            args["throughput_mb_s"] = round(span["bytes"] / (end - start) / 1024 ** 2, 2)
+        if span["failed"]:
+            args["failed"] = True
+        with self.lock:
+            if thread.ident not in self.lanes:
+                self.lanes.add(thread.ident)
+                self.events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread.ident,
+                                    "args": {"name": thread.name}})
+            self.events.append({"name": name, "cat": category, "ph": "X", "pid": os.getpid(), "tid": thread.ident,
+                                "ts": int((start - self.started) * 1e6), "dur": int((end - start) * 1e6), "args": args})
+
+    def write(self):
+        with self.lock:
+            events = list(self.events)
+        with open(f"{self.path}.tmp", "w") as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+        os.replace(f"{self.path}.tmp", self.path)
+        print(f"Trace with {sum(1 for event in events if event['ph'] == 'X')} spans written to {self.path}")
+
+TRACE = Tracer()
+
+def run_traced(name, category, path, task, *args, **kwargs):
+    with TRACE.span(name, category, path):
+        return task(*args, **kwargs)
+
+class WorkerBudget:
+    # Counting pool shared by concurrent dumps or restores so the sum of their -j values stays within the budget
+    def __init__(self, total):
+        self.available = total
+        self.condition = threading.Condition()
+
+    def acquire(self, count):
+        with self.condition:
+            self.condition.wait_for(lambda: self.available >= count)
+            self.available -= count
+
+    def release(self, count):
+        with self.condition:
+            self.available += count
+            self.condition.notify_all()
+
+def schedule_by_size(sizes, budget, parallel, task, caps=None):
+    # Largest units start first; each gets a worker share proportional to its size, capped so that the remaining
+    # parallel slots always have at least one worker left, and by caps (piped dumps load with one).
+    # Returns the outcome ("ok" when the task returns nothing), jobs and seconds of every unit; failed ones
+    # also carry their exception as "error".
+    total_size = sum(sizes.values()) or 1
+    worker_budget = WorkerBudget(budget)
+    results = {}
+
+    def run(name, jobs):
+        started = time.time()
+        try:
+            results[name] = {"status": task(name, jobs) or "ok", "jobs": jobs}
+        except Exception as e:
+            results[name] = {"status": f"failed: {e}", "jobs": jobs, "error": e}
+        results[name]["seconds"] = time.time() - started
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = []
+        for name, size in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+            jobs = budget if parallel == 1 else max(1, min(budget - parallel + 1, -(-budget * size // total_size)))
+            jobs = min(jobs, (caps or {}).get(name, jobs))
+            worker_budget.acquire(jobs)
+            future = executor.submit(run, name, jobs)
+            future.add_done_callback(lambda _, jobs=jobs: worker_budget.release(jobs))
+            futures.append(future)
+        for future in as_completed(futures):
+            future.result()
+    return results
+
+# Progress bar and per-collection completion lines printed by mongodump/mongorestore -vv
+MONGO_PROGRESS_PATTERN = re.compile(r"\[[#.]+\]\s+(\S+)\s+([\d.]+)([KMGT]?B)?/([\d.]+)([KMGT]?B)?\s+\(")
+MONGO_FINISHED_PATTERN = re.compile(r"(?:done dumping|finished restoring) (\S+) \((\d+) documents?")
+SIZE_UNITS = {None: 1, "B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+
+def run_mongo_tool(cmd, expected_units=None, interval=30, on_collection_done=None, start=subprocess.Popen, on_report=None):
+    # Waits on the tool itself while parsing its output. Progress units are bytes for
+    # mongorestore and documents for mongodump, matching what the tools print in their progress bars.
+    # The backup passes its start_process, so the tool is stopped with its store, and its set_status as on_report.
+    # The tool may sit behind a pipe or kubectl exec
+    tool = next((word for word in cmd.split() if word in ("mongodump", "mongorestore")), os.path.basename(cmd.split()[0]))
+    process = start(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+    started = last_report = time.time()
+    in_progress = {}
+    totals = {}
+    finished = {"collections": 0, "documents": 0, "units": 0}
+    units_are_bytes = False
+
+    def report():
+        elapsed = max(time.time() - started, 0.001)
+        units_done = finished["units"] + sum(in_progress.values())
+        documents = finished["documents"] + (0 if units_are_bytes else sum(in_progress.values()))
+        eta = "unknown"
+        if expected_units and units_done:
+            eta = format_duration(max(expected_units - units_done, 0) * elapsed / units_done)
+        summary = (f"{finished['collections']} collections done, {len(in_progress)} in progress, "
+                   f"{documents:.0f} documents ({documents / elapsed:.0f} docs/s), ETA {eta}")
+        print(f"[{tool}] {summary}", flush=True)
+        if on_report:
+            on_report(f"{tool}: {summary}")
+
+    # mongorestore builds the indexes after loading the data, so that part gets a span of its own
+    building_indexes = False
+    with contextlib.ExitStack() as index_builds:
+        for line in process.stdout:
+            print(line, end="", flush=True)
+            if "restoring indexes" in line and not building_indexes:
+                index_builds.enter_context(TRACE.span(f"{tool} index builds", "mongodb"))
+                building_indexes = True
+            match = MONGO_PROGRESS_PATTERN.search(line)
+            if match:
+                namespace, done, done_unit, total, total_unit = match.groups()
+                units_are_bytes = units_are_bytes or done_unit is not None
+                in_progress[namespace] = float(done) * SIZE_UNITS[done_unit]
+                totals[namespace] = float(total) * SIZE_UNITS[total_unit]
+            match = MONGO_FINISHED_PATTERN.search(line)
+            if match:
+                namespace = match.group(1)
+                in_progress.pop(namespace, None)
+                finished["collections"] += 1
+                finished["documents"] += int(match.group(2))
+                finished["units"] += totals.get(namespace, 0 if units_are_bytes else int(match.group(2)))
+                if on_collection_done:
+                    on_collection_done(namespace)
+            if time.time() - last_report >= interval:
+                report()
+                last_report = time.time()
+        process.wait()
+    report()
+    return process.returncode
@@ -1,5 +1,8 @@
 #!/bin/bash
 
+# With TRACE_FILE=<path> every phase below is written on exit as a span with its wall time, in the
+# Chrome trace format of full_backup_script.py --trace (open it in chrome://tracing or ui.perfetto.dev).
+
 scale_wait() {
   local name=$1
   local replicas=$2
@@ -21,12 +24,34 @@ patch_crd() {
   fi
 }
 
+trace_phase() {
+  # Ends the running phase and starts the next one; an empty name only ends it
+  local now=$(date +%s%6N)
+  if [[ -n "$TRACE_PHASE" ]]; then
+    TRACE_EVENTS+=("{\"name\": \"$TRACE_PHASE\", \"cat\": \"upgrade\", \"ph\": \"X\", \"pid\": $$, \"tid\": 1, \"ts\": $((TRACE_START - TRACE_ORIGIN)), \"dur\": $((now - TRACE_START)), \"args\": {}}")
+  fi
+  TRACE_PHASE=$1
+  TRACE_START=$now
+}
+
+write_trace() {
+  trace_phase ""
+  if [[ -n "$TRACE_FILE" ]]; then
+    local IFS=,
+    echo "{\"traceEvents\": [${TRACE_EVENTS[*]}], \"displayTimeUnit\": \"ms\"}" > "$TRACE_FILE"
+    echo "Trace with ${#TRACE_EVENTS[@]} spans written to $TRACE_FILE"
+  fi
+}
+
+TRACE_EVENTS=()
+TRACE_ORIGIN=$(date +%s%6N)
+trap write_trace EXIT
 
 set -x
 export NS="${NS:-upgrade1}"
 start_time=$(date +%s)
 
-
+trace_phase "patch CRDs"
 patch_crd "lrs.lrs.datarobot.com" $NS
 patch_crd "executionenvironments.predictions.datarobot.com" $NS
 patch_crd "inferenceservers.predictions.datarobot.com" $NS
@@ -34,6 +59,7 @@ patch_crd "notebooks.notebook.datarobot.com" $NS
 patch_crd "notebookvolumes.notebook.datarobot.com" $NS
 patch_crd "notebookvolumesnapshots.notebook.datarobot.com" $NS
 
+trace_phase "power off"
 # power off DR
 kubectl scale statefulset -l app.kubernetes.io/instance=dr --replicas=0 -n $NS
 kubectl scale deployment -l app.kubernetes.io/instance=dr --replicas=0 -n $NS
@@ -41,6 +67,7 @@ kubectl scale deployment -l app.kubernetes.io/instance=dr --replicas=0 -n $NS
 kubectl scale statefulset -l app.kubernetes.io/instance=pcs --replicas=0 -n $NS
 kubectl scale deployment -l app.kubernetes.io/instance=pcs --replicas=0 -n $NS
 
+trace_phase "retag PCS resources"
 # change labels from PCS to DR
 for kind in secret pvc networkpolicy serviceaccount configmap service role rolebinding pdb; do
     for sts in $(kubectl get $kind -l app.kubernetes.io/instance=pcs -n $NS -o jsonpath='{.items[*].metadata.name}'); do
@@ -50,6 +77,7 @@ for kind in secret pvc networkpolicy serviceaccount configmap service role roleb
     done
 done
 
+trace_phase "retain PCS volumes"
 # List all PVCs in the specified namespace
 kubectl get pvc -n $NS -o jsonpath='{.items[*].metadata.name}' | tr ' ' '\n' | while read pvc; do
     # Get the PV associated with the PVC
@@ -70,7 +98,7 @@ kubectl get pvc -n $NS -o jsonpath='{.items[*].metadata.name}' | tr ' ' '\n' | w
 done
 
 
-
+trace_phase "mongodb secret and FCV"
 scale_wait pcs-mongo 3 $NS
 
 export MONGODB_ROOT_USER="pcs-mongodb"
@@ -115,7 +143,7 @@ fi
 
 
 kubectl delete secret tmp-image-pullsecret -n $NS | true
-
+trace_phase "service secrets"
 echo "- fix rabbitmq secret"
 NEWSECRET=$(openssl rand -base64 24 | tr -dc 'A-Za-z0-9' | head -c 18 | base64)
 kubectl patch secret pcs-rabbitmq -n $NS -p "{\"data\":{\"rabbitmq-password\":\"$NEWSECRET\"}}"
@@ -128,6 +156,7 @@ echo "- fix elasticsearch secret"
 NEWSECRET=$(openssl rand -base64 24 | tr -dc 'A-Za-z0-9' | head -c 18 | base64)
 kubectl patch secret pcs-elasticsearch -n $NS -p "{\"data\":{\"elasticsearch-password\":\"$NEWSECRET\"}}"
 
+trace_phase "rabbitmq"
 rabbitmq_image_tag=$(kubectl get statefulset pcs-rabbitmq -n $NS -o jsonpath='{.spec.template.spec.containers[0].image}' | awk -F: '{print $2}')
 if [[ $rabbitmq_image_tag == 3.12* ]]; then
   echo "Image tag begins with 3.12 - no direct upgrade to 4.0.5"
@@ -142,6 +171,7 @@ if [[ $FF == "disabled" ]]; then
   kubectl exec -i -t -n $NS pcs-rabbitmq-0 -c rabbitmq -- bash -c "rabbitmqctl enable_feature_flag all"
 fi
 
+trace_phase "postgresql"
 scale_wait pcs-postgresql 3 $NS
 
 if kubectl get configmap pcs-postgresql-configuration -n $NS > /dev/null 2>&1; then
@@ -215,6 +245,7 @@ EOF'
   kubectl exec -i -t -n $NS pcs-postgresql-0 -c postgresql -- bash -c "/opt/bitnami/scripts/postgresql-repmgr/entrypoint.sh repmgr cluster show -f /opt/bitnami/repmgr/conf/repmgr.conf --compact"
 fi
 
+trace_phase "delete PCS workloads and secrets"
 echo "- delete PCS statefulset and deployment (helm upgrade is going to rebuilt it)"
 kubectl delete statefulset -l app.kubernetes.io/instance=pcs -n $NS
 kubectl delete deployment -l app.kubernetes.io/instance=pcs -n $NS
@@ -235,14 +266,14 @@ if kubectl get deployment auth-server-hydra -n $NS -o jsonpath='{.metadata.label
     kubectl delete deployment auth-server-hydra -n $NS
 fi
 
-
+trace_phase "helm upgrade"
 helm upgrade --install dr oci://registry-1.docker.io/datarobotdev/datarobot-prime --version 11.0.0-rc11 --debug -n $NS -f ./pcs.yaml -f ./dr-11p0.yaml --set pg-upgrade.enabled=$RUN_MAGRATION --timeout 30m
 
-
+trace_phase "delete helm secrets"
 for secrets in $(kubectl get secret -l owner=helm -l name=pcs -n $NS -o jsonpath='{.items[*].metadata.name}'); do
     kubectl delete secret $secrets -n $NS
 done
-
+trace_phase ""
 
 end_time=$(date +%s)
 elapsed_seconds=$((end_time - start_time))